@@ -1,50 +1,132 @@
 import os
+import sqlite3
+import time
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, session, make_response
+from flask_compress import Compress
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from flask_migrate import Migrate, stamp, upgrade
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user, UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHash, VerificationError
+from argon_autotune import argon2_parameters
 from werkzeug.utils import secure_filename
 from io import BytesIO
 import pandas as pd
 from functools import wraps
 from apscheduler.schedulers.background import BackgroundScheduler
-from sqlalchemy import inspect
+from sqlalchemy import bindparam, event, inspect, lambda_stmt, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import lazyload, load_only, selectinload
+from sqlalchemy.engine import Engine, make_url
 
 # Initialize Flask app
 app = Flask(__name__)
 
 # Configuration
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-me')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///worksmart.db').replace('postgres://', 'postgresql://')
+# Parse DATABASE_URL once at startup; Heroku-style 'postgres://' URLs use a name SQLAlchemy no longer accepts
+database_url = make_url(os.getenv('DATABASE_URL', 'sqlite:///worksmart.db'))
+if database_url.drivername == 'postgres':
+    database_url = database_url.set(drivername='postgresql')
+app.config['SQLALCHEMY_DATABASE_URI'] = database_url.render_as_string(hide_password=False)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['ALLOWED_EXTENSIONS'] = {'csv', 'xlsx', 'xls'}
 app.config['SCHEDULER_API_ENABLED'] = False
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+
+# PostgreSQL engine tuning: batched executemany() INSERTs and a warm, bounded connection pool
+if database_url.get_backend_name() == 'postgresql':
+    # Per worker process: one connection per gthread thread (see gunicorn.conf.py) plus the scheduler's
+    worker_threads = int(os.getenv('GUNICORN_THREADS', '4'))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'executemany_mode': 'values_plus_batch',
+        'executemany_values_page_size': 1000,
+        'executemany_batch_page_size': 500,
+        'pool_size': worker_threads + 1,
+        'max_overflow': 2,
+        'pool_timeout': 10,
+        # libpq keepalives detect dropped sockets, replacing the pre-ping round trip per checkout
+        'pool_recycle': 1800,
+        'pool_pre_ping': False,
+        'connect_args': {
+            'options': '-c statement_timeout=30000',
+            'keepalives': 1,
+            'keepalives_idle': 30,
+            'keepalives_interval': 10,
+            'keepalives_count': 5,
+        },
+    }
 
 # Initialize extensions
 db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+migrate = Migrate(app, db, directory=os.path.join(app.root_path, 'migrations'))
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
+Compress(app)
+
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL journaling for the SQLite fallback so the scheduler's writes don't block readers"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA mmap_size=134217728')
+    cursor.close()
+
+# Argon2id hasher shared by every password operation; OWASP minimums unless HASH_TARGET_MS is set.
+# Every role uses the same parameters, so a failed login takes the same time whatever the account
+# (or its absence) and timing never reveals which usernames belong to admins.
+password_hasher = PasswordHasher(**argon2_parameters())
+
+# Verified against when a username is unknown, so failed logins cost the same either way
+DUMMY_PASSWORD_HASH = password_hasher.hash('worksmart-unknown-user')
 
 # --- Models ---
 class User(db.Model, UserMixin):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    username = db.Column(db.String(80), nullable=False)
+    password_hash = db.Column(db.String(255))
     role = db.Column(db.String(20), default='user')
     approved = db.Column(db.Boolean, default=False)
-    facility_id = db.Column(db.Integer, db.ForeignKey('facilities.id'))
+    facility_id = db.Column(db.Integer, db.ForeignKey('facilities.id'), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    facility = db.relationship('Facility', back_populates='users', lazy='selectin')
+
+    __table_args__ = (
+        # Unique and covering: on PostgreSQL the login lookup is answered from the index alone
+        db.Index('ix_users_username_cover', 'username', unique=True,
+                 postgresql_include=['id', 'password_hash', 'role', 'approved', 'facility_id']),
+    )
+
+    # The columns login() reads, matching the covering index (load_only adds the primary key)
+    LOGIN_COLUMNS = ('username', 'password_hash', 'role', 'approved', 'facility_id')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        if not self.password_hash:
+            return False
+        # Accounts created before the switch to argon2 still carry Werkzeug pbkdf2 hashes
+        if not self.password_hash.startswith('$argon2'):
+            return check_password_hash(self.password_hash, password)
+        try:
+            return password_hasher.verify(self.password_hash, password)
+        except (VerificationError, InvalidHash):
+            return False
+
+    def password_needs_rehash(self):
+        """True for legacy pbkdf2 hashes and argon2 hashes made with outdated parameters"""
+        if not self.password_hash.startswith('$argon2'):
+            return True
+        return password_hasher.check_needs_rehash(self.password_hash)
 
 class Facility(db.Model):
     __tablename__ = 'facilities'
@@ -52,7 +134,7 @@ class Facility(db.Model):
     name = db.Column(db.String(200))
     location = db.Column(db.String(255))
     active = db.Column(db.Boolean, default=True)
-    users = db.relationship('User', backref='facility', lazy=True)
+    users = db.relationship('User', back_populates='facility', lazy='select')
 
 class Client(db.Model):
     __tablename__ = 'clients'
@@ -76,7 +158,13 @@ class Client(db.Model):
     transfer_facility = db.Column(db.String(100))
     transfer_date = db.Column(db.Date)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    tracking = db.relationship('Tracking', backref='client', lazy=True)
+    # Never needed on the dashboard; load explicitly with selectinload() where required
+    tracking = db.relationship('Tracking', back_populates='client', lazy='raise')
+
+    __table_args__ = (
+        db.Index('idx_clients_fac_status_pickup', 'facility_id', 'status', 'next_pickup'),
+        db.Index('idx_clients_fac_status_vl', 'facility_id', 'status', 'next_vl'),
+    )
 
 class Tracking(db.Model):
     __tablename__ = 'tracking'
@@ -84,12 +172,191 @@ class Tracking(db.Model):
     client_id = db.Column(db.Integer, db.ForeignKey('clients.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     intervention_type = db.Column(db.String(50))
-    intervention_date = db.Column(db.Date, default=datetime.utcnow().date)
+    intervention_date = db.Column(db.Date, default=lambda: datetime.utcnow().date())
     findings = db.Column(db.Text)
     followup_date = db.Column(db.Date)
     resolved = db.Column(db.Boolean, default=False)
+    client = db.relationship('Client', back_populates='tracking')
+
+    __table_args__ = (
+        # Leads with type/date so the scheduler's "reminded today" lookup is an index-only range scan
+        db.Index('idx_tracking_type_date_client', 'intervention_type', 'intervention_date', 'client_id'),
+    )
+
+class FacilityStats(db.Model):
+    """Precomputed dashboard counts per facility, refreshed by the scheduler or on demand"""
+    __tablename__ = 'facility_stats'
+    facility_id = db.Column(db.Integer, db.ForeignKey('facilities.id'), primary_key=True)
+    active_clients = db.Column(db.Integer, default=0)
+    due_pickup = db.Column(db.Integer, default=0)
+    due_vl = db.Column(db.Integer, default=0)
+    defaulters = db.Column(db.Integer, default=0)
+    stats_date = db.Column(db.Date)
+    stale = db.Column(db.Boolean, default=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped by every client write, so a refresh can tell whether the counts it read are still current
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+# --- Facility Cache ---
+# Facilities are few and rarely edited, so keep an in-process snapshot
+FACILITY_CACHE_TTL = 300
+_facility_cache = {'expires': 0.0, 'by_id': {}}
+
+def _facility_map():
+    """Return {id: facility row}, reloading from the database once the TTL lapses"""
+    now = time.monotonic()
+    if now >= _facility_cache['expires']:
+        rows = db.session.query(
+            Facility.id, Facility.name, Facility.location, Facility.active
+        ).order_by(Facility.id).all()
+        _facility_cache['by_id'] = {row.id: row for row in rows}
+        _facility_cache['expires'] = now + FACILITY_CACHE_TTL
+    return _facility_cache['by_id']
+
+def get_facility(facility_id):
+    """Cached facility lookup by id; returns None for unknown or empty ids"""
+    if not facility_id:
+        return None
+    return _facility_map().get(int(facility_id))
+
+def get_active_facilities():
+    """Cached list of active facilities, as offered on the login page"""
+    return [facility for facility in _facility_map().values() if facility.active]
+
+def invalidate_facility_cache(*args):
+    _facility_cache['expires'] = 0.0
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Facility, _event_name, invalidate_facility_cache)
+
+# --- User Loading ---
+USER_CACHE_TTL = 60
+_user_cache = {}
+
+# Built once; SQLAlchemy caches their compiled SQL under these fixed lambdas
+_user_by_id = lambda_stmt(
+    lambda: select(User).options(selectinload(User.facility)).where(User.id == bindparam('user_id'))
+)
+_user_by_username = lambda_stmt(
+    lambda: select(User)
+    .options(load_only(*User.LOGIN_COLUMNS), lazyload(User.facility))
+    .where(User.username == bindparam('username'))
+)
+
+@login_manager.user_loader
+def load_user(user_id):
+    """Flask-Login loader, cached briefly so authenticated requests skip the users SELECT"""
+    user_id = int(user_id)
+    cached = _user_cache.get(user_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    user = db.session.execute(_user_by_id, {'user_id': user_id}).scalar_one_or_none()
+    if user is None:
+        return None
+    # Detach the user and its facility so later commits can't expire what the cache holds
+    if user.facility is not None:
+        db.session.expunge(user.facility)
+    db.session.expunge(user)
+    _user_cache[user_id] = (time.monotonic() + USER_CACHE_TTL, user)
+    return user
+
+def invalidate_cached_user(mapper, connection, target):
+    _user_cache.pop(target.id, None)
+
+for _event_name in ('after_update', 'after_delete'):
+    event.listen(User, _event_name, invalidate_cached_user)
+
+# --- Dashboard Stats ---
+STAT_FIELDS = ('active_clients', 'due_pickup', 'due_vl', 'defaulters')
+
+def _count_facility_stats(today, facility_id=None):
+    """Dashboard counts keyed by facility id, from one grouped pass over clients"""
+    active = Client.status == 'active'
+    query = db.session.query(
+        Client.facility_id,
+        db.func.count(db.case((active, 1))).label('active_clients'),
+        db.func.count(db.case((db.and_(active, Client.next_pickup <= today), 1))).label('due_pickup'),
+        db.func.count(db.case((db.and_(active, Client.next_vl <= today), 1))).label('due_vl'),
+        db.func.count(db.case((Client.status == 'defaulter', 1))).label('defaulters'),
+    ).filter(Client.facility_id.isnot(None))
+    if facility_id is not None:
+        query = query.filter(Client.facility_id == facility_id)
+    return {
+        row.facility_id: {field: getattr(row, field) for field in STAT_FIELDS}
+        for row in query.group_by(Client.facility_id)
+    }
+
+def refresh_facility_stats(today, facility_id=None):
+    """Recompute and store the summary rows for one facility, or every facility with clients"""
+    query = db.session.query(FacilityStats.facility_id, FacilityStats.version)
+    if facility_id is not None:
+        query = query.filter(FacilityStats.facility_id == facility_id)
+    # Read versions before counting; a client write landing after this bumps the version,
+    # so the conditional UPDATE below leaves that row stale instead of hiding the write
+    seen_versions = dict(query.all())
+    counts = _count_facility_stats(today, facility_id)
+    if facility_id is not None:
+        counts.setdefault(facility_id, dict.fromkeys(STAT_FIELDS, 0))
+
+    now = datetime.utcnow()
+    for fid in set(counts) | set(seen_versions):
+        values = dict(dict.fromkeys(STAT_FIELDS, 0), **counts.get(fid, {}))
+        if fid in seen_versions:
+            db.session.execute(
+                FacilityStats.__table__.update()
+                .where(FacilityStats.facility_id == fid, FacilityStats.version == seen_versions[fid])
+                .values(stale=False, stats_date=today, updated_at=now, **values)
+            )
+        else:
+            # Until this row exists client writes have nothing to flag, so store it stale
+            db.session.add(FacilityStats(facility_id=fid, stale=True, stats_date=today, updated_at=now, **values))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker stored the same facility's row first; the counts are still valid
+        db.session.rollback()
+    return counts
+
+def get_facility_stats(facility_id, today):
+    """Dashboard counts for a facility, recomputed only when stale or from an earlier day"""
+    if not facility_id:
+        return dict.fromkeys(STAT_FIELDS, 0)
+    facility_id = int(facility_id)
+    summary = FacilityStats.query.get(facility_id)
+    if summary is None or summary.stale or summary.stats_date != today:
+        return refresh_facility_stats(today, facility_id)[facility_id]
+    return {field: getattr(summary, field) for field in STAT_FIELDS}
+
+def _mark_facility_stats_stale(mapper, connection, target):
+    """Flag the summary rows of every facility a client write touched"""
+    history = inspect(target).attrs.facility_id.history
+    facility_ids = {fid for fid in history.sum() if fid is not None}
+    if facility_ids:
+        connection.execute(
+            FacilityStats.__table__.update()
+            .where(FacilityStats.facility_id.in_(facility_ids))
+            .values(stale=True, version=FacilityStats.version + 1)
+        )
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Client, _event_name, _mark_facility_stats_stale)
 
 # --- Routes ---
+def _conditional_response(response):
+    """Tag a response with an ETag and answer 304 when the client already holds that body"""
+    response.add_etag()
+    etag, _ = response.get_etag()
+    # Flask-Compress sends the ETag with ':br' or ':gzip' appended, so compare without it
+    held = [tag for tag in request.if_none_match.as_set(include_weak=True) if tag.rsplit(':', 1)[0] == etag]
+    if not held:
+        return response
+    not_modified = make_response('', 304)
+    # Hand back the tag the client presented, encoding suffix included, to match its stored copy
+    not_modified.set_etag(held[0])
+    not_modified.headers['Cache-Control'] = response.headers.get('Cache-Control', 'no-cache')
+    return not_modified
+
 @app.route('/')
 def home():
     """Root endpoint that confirms the app is running"""
@@ -107,34 +374,54 @@ def login():
     
     if request.method == 'POST':
         username = request.form.get('username')
-        password = request.form.get('password')
-        facility_id = request.form.get('facility_id')
+        password = request.form.get('password', '')
         
-        user = User.query.filter_by(username=username).first()
+        user = db.session.execute(_user_by_username, {'username': username}).scalar_one_or_none()
         
-        if user and user.check_password(password) and user.approved:
+        if user is None:
+            try:
+                password_hasher.verify(DUMMY_PASSWORD_HASH, password)
+            except VerificationError:
+                pass
+        elif user.check_password(password) and user.approved:
+            # Upgrade old hashes while the plaintext is at hand
+            if user.password_needs_rehash():
+                user.set_password(password)
+                db.session.commit()
             login_user(user)
+            # The facility comes from the account, not the form; only admins may pick another one
+            facility_id = user.facility_id
+            requested = get_facility(request.form.get('facility_id', type=int))
+            if user.role == 'admin' and requested is not None and requested.active:
+                facility_id = requested.id
             session['facility_id'] = facility_id
             return redirect(url_for('dashboard'))
         
         flash('Invalid credentials or account not approved', 'danger')
     
-    facilities = Facility.query.filter_by(active=True).all()
-    return render_template('auth/login.html', facilities=facilities)
+    return render_template('auth/login.html', facilities=get_active_facilities())
 
 @app.route('/dashboard')
 @login_required
 def dashboard():
     facility_id = session.get('facility_id')
-    stats = {
-        'active_clients': Client.query.filter_by(facility_id=facility_id, status='active').count(),
-        'due_pickup': Client.query.filter(
-            Client.facility_id == facility_id,
-            Client.status == 'active',
-            Client.next_pickup <= datetime.now().date()
-        ).count(),
-    }
-    return render_template('dashboard.html', stats=stats)
+    stats = get_facility_stats(facility_id, datetime.now().date())
+    response = make_response(render_template('dashboard.html', stats=stats, current_facility=get_facility(facility_id)))
+    # Revalidate every time; the ETag makes an unchanged dashboard a cheap 304
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return _conditional_response(response)
+
+@app.route('/api/clients/stats')
+@login_required
+def api_client_stats():
+    """Client counts by status for the user's facility, or across all facilities for admins"""
+    query = db.session.query(Client.status, db.func.count(Client.id)).filter(Client.status.isnot(None))
+    if current_user.role != 'admin':
+        # A user without a facility sees nothing, not the clients that lack one
+        if current_user.facility_id is None:
+            return jsonify({})
+        query = query.filter(Client.facility_id == current_user.facility_id)
+    return jsonify(dict(query.group_by(Client.status).all()))
 
 # --- Database Initialization ---
 def initialize_database():
@@ -143,19 +430,13 @@ def initialize_database():
         inspector = inspect(db.engine)
         existing_tables = inspector.get_table_names()
         
-        # Only create tables if they don't exist
+        # create_all() never alters existing tables; migrations bring an existing schema up to date
+        if 'users' in existing_tables:
+            upgrade()
+        db.create_all()
+
+        # Seed only a brand-new database
         if 'users' not in existing_tables:
-            db.create_all()
-            
-            # Add initial admin user
-            admin = User(
-                username='admin',
-                role='admin',
-                approved=True
-            )
-            admin.set_password('admin')
-            db.session.add(admin)
-            
             # Add default facility
             facility = Facility(
                 name='Main Facility',
@@ -163,15 +444,104 @@ def initialize_database():
                 active=True
             )
             db.session.add(facility)
+            
+            # Add initial admin user, assigned to the default facility
+            admin = User(
+                username='admin',
+                role='admin',
+                approved=True,
+                facility=facility
+            )
+            admin.set_password('admin')
+            db.session.add(admin)
             db.session.commit()
+            # create_all() built the current schema, so no migration applies to it
+            stamp()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Migrate an existing database, or create and seed a fresh one, once per deploy"""
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    initialize_database()
 
 # --- Scheduler ---
+def _days_between(column, day):
+    """SQL expression for the whole days from a date column to a given day"""
+    if db.engine.dialect.name == 'sqlite':
+        return db.cast(db.func.julianday(day) - db.func.julianday(column), db.Integer)
+    return db.literal(day, db.Date) - column
+
+REMINDER_JOB_LOCK_ID = 727001
+
+def _try_job_lock(lock_id):
+    """Take a transaction-scoped PostgreSQL advisory lock; always succeeds on other backends"""
+    if db.engine.dialect.name != 'postgresql':
+        return True
+    return db.session.execute(
+        db.text('SELECT pg_try_advisory_xact_lock(:lock_id)'), {'lock_id': lock_id}
+    ).scalar()
+
 def check_due_clients():
+    """Log a reminder for active clients due within a week or up to four weeks overdue"""
     with app.app_context():
-        # Your existing scheduler logic here
-        pass
+        # Only one worker may run the job at a time; the lock ends with this transaction
+        if not _try_job_lock(REMINDER_JOB_LOCK_ID):
+            return
+
+        today = datetime.now().date()
+        lo = today - timedelta(days=28)
+        hi = today + timedelta(days=7)
+
+        # Clients already reminded today, excluded by the database as an anti-join
+        reminded_today = db.exists().where(
+            Tracking.client_id == Client.id,
+            Tracking.intervention_type == 'reminder',
+            Tracking.intervention_date == today
+        )
+
+        # Due and overdue clients in one range scan, with lateness computed by the database
+        clients = db.session.query(
+            Client.id,
+            Client.next_pickup,
+            _days_between(Client.next_pickup, today).label('days_late')
+        ).filter(
+            Client.status == 'active',
+            Client.next_pickup.between(lo, hi),
+            ~reminded_today
+        ).all()
+
+        rows = []
+        for client in clients:
+            if client.days_late > 0:
+                findings = f'Automated reminder: pickup overdue by {client.days_late} days'
+            else:
+                findings = f'Automated reminder: pickup due on {client.next_pickup.isoformat()}'
+            rows.append({
+                'client_id': client.id,
+                'intervention_type': 'reminder',
+                'intervention_date': today,
+                'findings': findings,
+                'followup_date': client.next_pickup,
+                'resolved': False
+            })
+
+        # One executemany INSERT instead of a unit-of-work flush per reminder
+        if rows:
+            db.session.bulk_insert_mappings(Tracking, rows)
+            db.session.commit()
+
+        # Due counts shift as the date rolls over, so rebuild every facility's summary
+        refresh_facility_stats(today)
+
+@app.cli.command('run-reminders')
+def run_reminders_command():
+    """Run the reminder job once, e.g. from cron instead of the in-process scheduler"""
+    check_due_clients()
 
 def init_scheduler():
+    # Set SCHEDULER_ENABLED=0 on web workers when reminders run from 'flask run-reminders'
+    if os.getenv('SCHEDULER_ENABLED', '1') != '1':
+        return
     if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
         scheduler = BackgroundScheduler()
         scheduler.add_job(func=check_due_clients, trigger="interval", days=1)
@@ -182,8 +552,9 @@ def create_app():
     # Create upload directory
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
-    # Initialize database safely
-    initialize_database()
+    # Database setup normally runs once per deploy via 'flask init-db'; opt in for local runs
+    if os.getenv('FLASK_INIT_DB') == '1':
+        initialize_database()
     
     # Initialize scheduler
     init_scheduler()
@@ -0,0 +1,80 @@
+"""Pick Argon2 cost parameters that meet a login latency target on the current host"""
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from argon2 import PasswordHasher
+
+# OWASP minimums, used as-is when no latency target is configured
+DEFAULT_PARAMS = {'time_cost': 2, 'memory_cost': 19456, 'parallelism': 1}
+# Per hash, in KiB; every worker thread may be hashing at once, so keep this modest
+DEFAULT_MAX_MEMORY_COST = 65536
+MAX_TIME_COST = 10
+SAMPLES = 5
+
+def _median_hash_ms(params):
+    hasher = PasswordHasher(**params)
+    timings = []
+    for _ in range(SAMPLES):
+        start = time.perf_counter()
+        hasher.hash('probe')
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def calculate_optimal_params(min_ms=250, max_memory_cost=DEFAULT_MAX_MEMORY_COST):
+    """Grow memory cost first (GPU resistance), then time cost, until a hash takes min_ms"""
+    # Start from the OWASP minimums so a slow host never ends up below them
+    params = dict(DEFAULT_PARAMS)
+    while params['memory_cost'] < max_memory_cost:
+        grown = dict(params, memory_cost=min(params['memory_cost'] * 2, max_memory_cost))
+        if _median_hash_ms(grown) >= min_ms:
+            break
+        params = grown
+    while params['time_cost'] < MAX_TIME_COST and _median_hash_ms(params) < min_ms:
+        params['time_cost'] += 1
+    return params
+
+def _settings():
+    """Latency target, memory cap and cache file from the environment; the target is None when unset"""
+    target_ms = os.getenv('HASH_TARGET_MS')
+    max_memory_cost = int(os.getenv('HASH_MAX_MEMORY_MIB', DEFAULT_MAX_MEMORY_COST // 1024)) * 1024
+    return (int(target_ms) if target_ms else None,
+            max(max_memory_cost, DEFAULT_PARAMS['memory_cost']),
+            os.getenv('HASH_PARAMS_FILE', 'argon2_params.json'))
+
+def _write_atomic(path, data):
+    """Replace path with data in one step, so readers never see a partly written file"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def tune_params():
+    """Measure this host and store the result for workers to read; None when HASH_TARGET_MS is unset"""
+    target_ms, max_memory_cost, cache_path = _settings()
+    if target_ms is None:
+        return None
+    params = calculate_optimal_params(target_ms, max_memory_cost)
+    _write_atomic(cache_path, {'target_ms': target_ms, 'max_memory_cost': max_memory_cost, 'params': params})
+    return params
+
+def argon2_parameters():
+    """Hasher parameters for this process: those stored by tune_params(), else DEFAULT_PARAMS"""
+    # Never tune here: workers measuring at once contend for the CPU and settle on different costs
+    target_ms, max_memory_cost, cache_path = _settings()
+    if target_ms is None:
+        return dict(DEFAULT_PARAMS)
+    try:
+        with open(cache_path) as f:
+            stored = json.load(f)
+        if stored.get('target_ms') == target_ms and stored.get('max_memory_cost') == max_memory_cost:
+            return stored['params']
+    except (OSError, ValueError, KeyError):
+        pass
+    return dict(DEFAULT_PARAMS)
@@ -0,0 +1,44 @@
+"""Gunicorn settings, picked up automatically from the working directory"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# Cores this process may run on; cpu_count() reports the whole host, even inside a small container
+try:
+    usable_cpus = len(os.sched_getaffinity(0))
+except AttributeError:
+    usable_cpus = os.cpu_count() or 1
+
+# Logins spend most of their time in argon2 (parallelism=1), so spread processes across cores
+# and let each one overlap database waits with a few threads. Without WEB_CONCURRENCY, stay
+# at a few workers: each imports pandas and holds its own database pool.
+MAX_DEFAULT_WORKERS = 4
+workers = int(os.getenv('WEB_CONCURRENCY', min(usable_cpus * 2, MAX_DEFAULT_WORKERS)))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+def post_worker_init(worker):
+    """Run the reminder scheduler in one worker per host; 'gunicorn app:app' never calls create_app()"""
+    import fcntl
+    lock_file = open(os.getenv('SCHEDULER_LOCK_FILE', '/tmp/worksmart-scheduler.lock'), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return
+    # Held until this worker exits, so a replacement worker can take over the scheduler
+    worker.scheduler_lock_file = lock_file
+
+    from app import init_scheduler
+    init_scheduler()
+
+def on_starting(server):
+    """Tune argon2 once in the master, before any worker exists to compete for the CPU"""
+    from argon_autotune import tune_params
+    try:
+        params = tune_params()
+    except OSError as exc:
+        server.log.warning('Could not store tuned argon2 parameters, workers will use the defaults: %s', exc)
+        return
+    if params:
+        server.log.info('Tuned argon2 parameters: %s', params)